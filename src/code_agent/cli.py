@@ -36,13 +36,14 @@ def main():
     # ensure we have cloning auth if needed.
     # For now, we assume public repo or token in env for git
     
-    if args.pr_number:
-        service.process_pr_feedback(args.pr_number)
-    elif args.issue_id:
-        service.process_issue(args.issue_id)
-    else:
-        print("Error: Either --issue-id or --pr-number must be provided.")
-        sys.exit(1)
+    with service:
+        if args.pr_number:
+            service.process_pr_feedback(args.pr_number)
+        elif args.issue_id:
+            service.process_issue(args.issue_id)
+        else:
+            print("Error: Either --issue-id or --pr-number must be provided.")
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,21 +1,283 @@
+import ast
+import functools
+import hashlib
+import itertools
+import json
 import os
+import re
+import shutil
+import stat
 import subprocess
-from typing import Dict, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from github import Github, Repository, PullRequest
 from git import Repo
 
 from shared.llm import LLMClient
-from shared.utils import generate_repo_map
+from shared.utils import DEFAULT_IGNORE_DIRS, generate_repo_map
 from shared.diff_manager import DiffManager
 
+# File types whose contents are included in the LLM context
+_CODE_EXTS = frozenset({
+    '.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', '.go', '.rs',
+    '.md', '.txt', '.json', '.yaml', '.yml',
+})
+# Approximate token budget for file contents included in the LLM context
+CONTEXT_TOKEN_BUDGET = 16000
+# Upper bound on bytes of code per token; a file larger than budget times this
+# cannot fit, so such files are skipped on their stat size without being read
+MAX_BYTES_PER_TOKEN = 8
+
+_KEYWORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+def _iter_code_files(
+    root: str, max_size: int, base: Optional[str] = None
+) -> Iterator[Tuple[str, str, int]]:
+    """
+    Recursively yields (path, rel_path, size) for code files under root.
+    Hidden and common non-code directories are skipped, and files of max_size
+    bytes or more are filtered on their stat size without being opened.
+    """
+    base = base or root
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                name = entry.name
+                if not name.startswith('.') and name not in DEFAULT_IGNORE_DIRS:
+                    yield from _iter_code_files(entry.path, max_size, base)
+            elif entry.is_file():
+                if os.path.splitext(entry.name)[1] not in _CODE_EXTS:
+                    continue
+                size = entry.stat().st_size
+                if size < max_size:
+                    yield entry.path, os.path.relpath(entry.path, base), size
+        except OSError:
+            continue
+
+@functools.lru_cache(maxsize=1)
+def _get_token_encoder() -> Optional[Callable[[str], int]]:
+    """Returns a token counting function, or None if tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with tiktoken if available, else estimates ~4 chars per token.
+    tiktoken is not a declared dependency, so the default install (and the
+    Docker image) always uses the estimate.
+    """
+    encoder = _get_token_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return encoder(text)
+
+def select_context_files(
+    root: str, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> List[Tuple[str, str]]:
+    """
+    Picks the code files most relevant to query that fit within token_budget.
+    Files are ranked by how many query keywords appear in their path (shorter
+    files first on ties) and packed greedily; lower-ranked files are only read
+    while there is budget left. Returns (rel_path, content) pairs in rank order.
+    """
+    keywords = {tok.lower() for tok in _KEYWORD_RE.findall(query)}
+    candidates = []
+    for path, rel_path, size in _iter_code_files(
+        root, max_size=token_budget * MAX_BYTES_PER_TOKEN
+    ):
+        rel_lower = rel_path.lower()
+        score = sum(tok in rel_lower for tok in keywords)
+        candidates.append((-score, size, rel_path, path))
+    candidates.sort()
+
+    selected = []
+    remaining = token_budget
+    for _, size, rel_path, path in candidates:
+        # Cheap lower bound on the file's tokens before reading it
+        if size // MAX_BYTES_PER_TOKEN > remaining:
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            # Unreadable or binary files are simply left out of the context
+            continue
+        tokens = count_tokens(content)
+        if tokens <= remaining:
+            selected.append((rel_path, content))
+            remaining -= tokens
+        if remaining <= 0:
+            break
+    return selected
+
+def _write_if_changed(path: str, data: bytes) -> bool:
+    """
+    Writes data to path unless the file already holds exactly these bytes.
+    Returns True if the file was written.
+    """
+    try:
+        if os.stat(path).st_size == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return True
+
+@functools.lru_cache(maxsize=32)
+def _repo_map_cached(sha: str, path: str, cache_dir: str) -> str:
+    """
+    Returns the repo map for a checkout at commit `sha`, memoized in-process
+    and persisted to cache_dir so it survives restarts.
+    """
+    cache_file = os.path.join(cache_dir, f"repo_map.{sha}.txt")
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        pass
+
+    repo_map = generate_repo_map(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            f.write(repo_map)
+    except OSError as e:
+        print(f"Warning: Could not persist repo map cache: {e}")
+    return repo_map
+
+# Below this many files the process pool startup outweighs the parallel check
+PARALLEL_SYNTAX_CHECK_MIN_FILES = 4
+
+def _check_one(path_and_source: Tuple[str, str]) -> Tuple[str, Optional[str]]:
+    """
+    Parses and compiles a single source file. Returns (path, syntax error
+    message or None); files that parse are left for ruff to lint.
+    """
+    path, source = path_and_source
+    try:
+        tree = ast.parse(source, filename=path, mode='exec')
+        # Compiling the parsed tree catches errors the parser alone accepts
+        # (e.g. 'return' outside a function) without re-parsing the source.
+        compile(tree, path, 'exec', dont_inherit=True, optimize=2)
+    except SyntaxError as e:
+        return path, f"SyntaxError in {path}: {e}"
+    except Exception as e:
+        return path, f"Error reading/compiling {path}: {e}"
+    return path, None
+
+def batch_lint(paths: List[str], cache_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Runs ruff (E, F rules) once over all given paths.
+    If cache_dir is given, ruff keeps its per-file results there so files
+    unchanged since a previous run are not re-linted.
+    Returns a dict mapping absolute file path -> formatted linter errors.
+    Files without errors are omitted.
+    """
+    if not paths:
+        return {}
+
+    args = ["ruff", "check", "--select", "E,F", "--output-format", "json"]
+    if cache_dir:
+        args += ["--cache-dir", cache_dir]
+
+    try:
+        result = subprocess.run(
+            [*args, *paths],
+            capture_output=True,
+            text=True,
+            shell=False
+        )
+    except FileNotFoundError:
+        # ruff not installed - skip linting
+        print("Warning: ruff not found, skipping lint check")
+        return {}
+    except Exception as e:
+        # Other errors - just warn, don't fail
+        print(f"Warning: Error running linter: {e}")
+        return {}
+
+    if result.returncode == 0:
+        return {}
+
+    try:
+        diagnostics = json.loads(result.stdout)
+    except (TypeError, ValueError):
+        # Only fail on actual lint errors, not on ruff exit codes
+        print(f"Warning: Could not parse linter output: {result.stderr}")
+        return {}
+
+    errors: Dict[str, List[str]] = {}
+    for entry in diagnostics:
+        path = os.path.abspath(entry.get("filename", ""))
+        location = entry.get("location") or {}
+        errors.setdefault(path, []).append(
+            f"{path}:{location.get('row')}:{location.get('column')}: "
+            f"{entry.get('code')} {entry.get('message')}"
+        )
+
+    return {
+        path: f"Linter Errors in {path}:\n" + "\n".join(lines)
+        for path, lines in errors.items()
+    }
+
+
 class CodeAgentService:
     def __init__(self, github_token: str, repo_name: str, llm_client: LLMClient):
         self.github_token = github_token
         self.github = Github(github_token)
         self.repo: Repository.Repository = self.github.get_repo(repo_name)
+        # get_repo returns a fully loaded repository; snapshot the fields used
+        # on every run so they are read from one place.
+        self._full_name = self.repo.full_name
+        self._clone_url = self.repo.clone_url
+        self._default_branch = self.repo.default_branch
         self.llm_client = llm_client
         self.local_repo_path = os.path.join(os.getcwd(), "workdir")
+        # Kept outside the checkout so it is neither wiped on re-clone nor
+        # listed in the repo map
+        self.cache_dir = os.path.join(os.getcwd(), ".agent_cache")
+        # ruff's default cache lives in the checkout and is wiped by `git clean`;
+        # keeping it here lets it stay warm across retries and runs.
+        self.ruff_cache_dir = os.path.join(self.cache_dir, "ruff")
+        self._last_hash: Dict[str, bytes] = {}
+        self._last_error: Dict[str, Optional[str]] = {}
+        self._applied: Dict[str, str] = {}
         self.diff_manager = DiffManager()
+        # Created by the first parallel check_many and reused across
+        # validate_and_fix retries; shut down by close()
+        self._syntax_pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "CodeAgentService":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the syntax check worker processes, if any were started."""
+        if self._syntax_pool is not None:
+            self._syntax_pool.shutdown()
+            self._syntax_pool = None
     
     def setup_local_repo(self, branch_name: str = "main"):
 
@@ -34,53 +296,63 @@ class CodeAgentService:
 
     def get_feedback_history(self, pr: PullRequest.PullRequest) -> str:
         """Fetches identifying feedback from recent PR comments to build history."""
-        comments = list(pr.get_issue_comments())
+        # Take last 3 comments to provide context without overflowing context window.
+        # Iterating the reversed list starts from the last page, so older
+        # pages are never fetched.
+        comments = list(itertools.islice(pr.get_issue_comments().reversed, 3))
         if not comments:
             return "No prior feedback."
         
-        # Take last 3 comments to provide context without overflowing context window
         history = []
-        for c in comments[-3:]:
+        for c in reversed(comments):
             history.append(f"--- Comment by {c.user.login} ---\n{c.body}")
         
         return "\n\n".join(history)
 
+    def check_many(
+        self, items: List[Tuple[str, str]]
+    ) -> Dict[str, Optional[str]]:
+        """
+        Syntax-checks many (path, source) pairs, in parallel for larger change
+        sets. Returns a dict mapping path -> syntax error message or None.
+        """
+        results: Optional[List[Tuple[str, Optional[str]]]] = None
+        if len(items) >= PARALLEL_SYNTAX_CHECK_MIN_FILES:
+            try:
+                if self._syntax_pool is None:
+                    self._syntax_pool = ProcessPoolExecutor(
+                        max_workers=os.cpu_count()
+                    )
+                results = list(self._syntax_pool.map(_check_one, items, chunksize=4))
+            except Exception as e:
+                print("Warning: Parallel syntax check failed, "
+                      f"falling back to serial: {e}")
+                # A broken pool fails every later map; start fresh next time.
+                if self._syntax_pool is not None:
+                    self._syntax_pool.shutdown(wait=False)
+                    self._syntax_pool = None
+        if results is None:
+            results = [_check_one(item) for item in items]
+        return dict(results)
+
     def check_code(self, filename: str) -> Optional[str]:
         """Checks for syntax errors and runs linter. Returns error message or None."""
         # Only check Python files
         if not filename.endswith('.py'):
             return None
-            
-        # 1. Syntax Check
+
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 source = f.read()
-            compile(source, filename, 'exec')
-        except SyntaxError as e:
-            return f"SyntaxError in {filename}: {e}"
         except Exception as e:
             return f"Error reading/compiling {filename}: {e}"
 
-        # 2. Linter Check (Ruff E, F) - optional, skip if ruff not available
-        try:
-            result = subprocess.run(
-                ["ruff", "check", "--select", "E,F", filename], 
-                capture_output=True, 
-                text=True,
-                shell=False 
-            )
-            if result.returncode != 0:
-                # Only fail on actual lint errors, not on ruff exit codes
-                if result.stdout.strip():
-                    return f"Linter Errors in {filename}:\n{result.stdout}"
-        except FileNotFoundError:
-            # ruff not installed - skip linting
-            print(f"Warning: ruff not found, skipping lint check for {filename}")
-        except Exception as e:
-            # Other errors - just warn, don't fail
-            print(f"Warning: Error running linter on {filename}: {e}")
-        
-        return None
+        _, error = _check_one((filename, source))
+        if error:
+            return error
+
+        lint_errors = batch_lint([filename], self.ruff_cache_dir)
+        return lint_errors.get(os.path.abspath(filename))
 
     def validate_and_fix(self, changes: Dict[str, str], repo_git: Repo) -> bool:
         """Applies changes, validates them, and attempts auto-fix loops."""
@@ -93,13 +365,23 @@ class CodeAgentService:
         if not changes:
             print("ERROR: No changes to apply!")
             return False
+
+        # Per-file digest of the incoming change and the validation result it
+        # produced, so retries skip files the LLM fix did not touch.
+        self._last_hash = {}
+        self._last_error = {}
+        # Content of each file as last written (or as found on disk when a
+        # diff failed to apply), so the retry prompt needs no disk reads.
+        self._applied = {}
         
         while retry_count < max_retries:
             print(f"\nApplying changes (Attempt {retry_count + 1}/{max_retries})...")
             
             files_with_errors = []
             files_written = 0
-            
+            written_sources: Dict[str, Tuple[str, str]] = {}
+            valid_files: List[str] = []
+
             # 1. Write Files
             for filename, content in changes.items():
                 print(f"\nProcessing file: {filename}")
@@ -126,27 +408,78 @@ class CodeAgentService:
                     print(f"Skipping {filename}: content is not a string ({type(final_content)})")
                     continue
 
+                digest = hashlib.blake2b(
+                    final_content.encode("utf-8"), digest_size=16
+                ).digest()
+                if self._last_hash.get(filename) == digest:
+                    # Unchanged since the previous attempt: already written and
+                    # validated (and diffs must not be applied twice).
+                    print(f"{filename} unchanged since last attempt, "
+                          "reusing its result")
+                    error = self._last_error.get(filename)
+                    if error:
+                        files_with_errors.append((filename, error))
+                    continue
+                self._last_hash[filename] = digest
+                self._last_error[filename] = None
+
                 if "<<<<<< SEARCH" in final_content and os.path.exists(full_path):
+                     original = None
                      try:
                          with open(full_path, 'r', encoding='utf-8') as f:
                              original = f.read()
                          final_content = self.diff_manager.apply_diff(original, final_content)
                      except ValueError as e:
+                         # Also reached when the read fails (UnicodeDecodeError)
                          print(f"Error applying diff to {filename}: {e}")
+                         self._applied[filename] = (
+                             original if original is not None else final_content
+                         )
+                         self._last_error[filename] = f"Diff Application Error: {e}"
                          files_with_errors.append((filename, f"Diff Application Error: {e}"))
                          continue
                 
-                print(f"Writing {len(final_content)} characters to {filename}...")
-                with open(full_path, "w", encoding="utf-8") as f:
-                    f.write(final_content)
-                
-                # 2. Check Code
-                error = self.check_code(full_path)
+                self._applied[filename] = final_content
+                data = final_content.encode("utf-8")
+                if _write_if_changed(full_path, data):
+                    print(f"Wrote {len(data)} bytes to {filename}")
+                else:
+                    print(f"{filename} is unchanged on disk ({len(data)} bytes), "
+                          "skipping write")
+
+                if full_path.endswith('.py'):
+                    written_sources[full_path] = (filename, final_content)
+                else:
+                    valid_files.append(filename)
+
+            # 2. Syntax check all written Python files
+            results = self.check_many(
+                [(path, source) for path, (_, source) in written_sources.items()]
+            )
+            lint_candidates = {}
+            for path, (filename, _) in written_sources.items():
+                error = results[path]
                 if error:
                     print(f"Validation failed for {filename}: {error}")
+                    self._last_error[filename] = error
                     files_with_errors.append((filename, error))
                 else:
-                    repo_git.index.add([filename]) # Stage valid files
+                    lint_candidates[os.path.abspath(path)] = filename
+
+            # 2b. Lint every file that parsed in a single ruff run
+            lint_errors = batch_lint(list(lint_candidates), self.ruff_cache_dir)
+            for path, filename in lint_candidates.items():
+                error = lint_errors.get(path)
+                if error:
+                    print(f"Validation failed for {filename}: {error}")
+                    self._last_error[filename] = error
+                    files_with_errors.append((filename, error))
+                else:
+                    valid_files.append(filename)
+
+            # Stage all valid files with a single index update
+            if valid_files:
+                repo_git.index.add(valid_files)
 
             # 3. Decision
             if not files_with_errors:
@@ -161,21 +494,18 @@ class CodeAgentService:
             
             print("Requesting fixes from LLM...")
             # Construct error report
-            error_report = "The code has syntax or linter errors:\n"
+            report_parts = ["The code has syntax or linter errors:\n"]
             for fname, err in files_with_errors:
-                error_report += f"File: {fname}\nError: {err}\n"
+                report_parts.append(f"File: {fname}\nError: {err}\n")
+            error_report = "".join(report_parts)
             
-            # We need to pass current (broken) code so LLM sees what it generated
-            # For diffs, this is tricky. We should pass the file content AS IT IS ON DISK (broken or partial)
-            current_broken_code = {}
-            for fname, _ in files_with_errors:
-                 # Read from disk
-                 full_path = os.path.join(self.local_repo_path, fname)
-                 if os.path.exists(full_path):
-                     with open(full_path, 'r') as f:
-                         current_broken_code[fname] = f.read()
-                 else:
-                     current_broken_code[fname] = changes.get(fname, "")
+            # We need to pass current (broken) code so LLM sees what it generated.
+            # For diffs this is the content after the diff was applied, i.e.
+            # what is on disk.
+            current_broken_code = {
+                fname: self._applied.get(fname, changes.get(fname, ""))
+                for fname, _ in files_with_errors
+            }
 
             # Ask LLM to fix only broken files
             fixed_changes = self.llm_client.fix_code(current_broken_code, error_report)
@@ -186,11 +516,33 @@ class CodeAgentService:
         return False
 
     def _ensure_local_repo(self) -> Repo:
-        """Clones the repository if it doesn't exist, or ensures it's clean."""
-        if os.path.exists(self.local_repo_path):
-            import shutil
-            import stat
+        """
+        Reuses an existing checkout by fetching and hard-resetting it to the
+        default branch. Falls back to a fresh shallow clone if none exists or
+        the existing one cannot be updated.
+        """
+        # Use GitHub token for cloning
+        auth_url = self._clone_url.replace("https://", f"https://oauth2:{self.github_token}@")
+        default_branch = self._default_branch
 
+        if os.path.exists(os.path.join(self.local_repo_path, ".git")):
+            try:
+                print(f"Updating existing repository {self._full_name}...")
+                repo_git = Repo(self.local_repo_path)
+                origin = repo_git.remotes.origin
+                if origin.url != auth_url:
+                    origin.set_url(auth_url)
+                origin.fetch(prune=True)
+                repo_git.git.reset("--hard")
+                repo_git.git.checkout(
+                    "-f", "-B", default_branch, f"origin/{default_branch}"
+                )
+                repo_git.git.clean("-fdx")
+                return repo_git
+            except Exception as e:
+                print(f"Could not update existing repository, re-cloning: {e}")
+
+        if os.path.exists(self.local_repo_path):
             def on_rm_error(func, path, exc_info):
                 # path contains the path of the file that couldn't be removed
                 # let's try to change the mode and retry
@@ -200,54 +552,52 @@ class CodeAgentService:
             print(f"Cleaning up existing directory {self.local_repo_path}...")
             shutil.rmtree(self.local_repo_path, onerror=on_rm_error)
 
-        print(f"Cloning repository {self.repo.full_name}...")
-        # Use GitHub token for cloning
-        auth_url = self.repo.clone_url.replace("https://", f"https://oauth2:{self.github_token}@")
-        return Repo.clone_from(auth_url, self.local_repo_path)
+        print(f"Cloning repository {self._full_name}...")
+        # Shallow clone keeps the transfer small; all branches are still fetched
+        # so PR head branches can be checked out.
+        return Repo.clone_from(
+            auth_url, self.local_repo_path, depth=50, no_single_branch=True
+        )
 
     def process_issue(self, issue_id: int):
         """Orchestrates the fix for a specific issue."""
         print(f"Processing Issue #{issue_id}...")
-        try:
-            issue = self.repo.get_issue(issue_id)
-            print(f"Issue title: {issue.title}")
-            print(f"Issue body: {issue.body}")
-        except Exception as e:
-            print(f"Error fetching issue: {e}")
-            return
+        # The issue fetch and the clone/fetch of the repository are independent
+        # network round-trips, so overlap them.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            issue_future = executor.submit(self.repo.get_issue, issue_id)
+            repo_future = executor.submit(self._ensure_local_repo)
 
-        try:
-            repo_git = self._ensure_local_repo()
-        except Exception as e:
-            print(f"Error preparing repository: {e}")
-            return
+            try:
+                issue = issue_future.result()
+                print(f"Issue title: {issue.title}")
+                print(f"Issue body: {issue.body}")
+            except Exception as e:
+                print(f"Error fetching issue: {e}")
+                return
+
+            try:
+                repo_git = repo_future.result()
+            except Exception as e:
+                print(f"Error preparing repository: {e}")
+                return
         
         try:
-            repo_map = generate_repo_map(self.local_repo_path)
+            repo_map = self.get_repo_map(repo_git)
             print(f"Repository map generated ({len(repo_map)} chars)")
         except Exception as e:
             print(f"Error generating repo map: {e}")
             repo_map = ""
 
-        # Read contents of key files to provide context
-        file_contents = ""
-        for root, dirs, files in os.walk(self.local_repo_path):
-            # Skip hidden directories and common non-code dirs
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['__pycache__', 'node_modules', 'venv', '.git']]
-            for file in files:
-                if file.endswith(('.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', '.go', '.rs', '.md', '.txt', '.json', '.yaml', '.yml')):
-                    file_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(file_path, self.local_repo_path)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        # Limit file size in context
-                        if len(content) < 5000:
-                            file_contents += f"\n\n=== File: {rel_path} ===\n{content}"
-                    except Exception:
-                        pass
+        # Read contents of the most relevant files that fit the context budget
+        query = f"{issue.title}\n{issue.body or ''}"
+        selected = select_context_files(self.local_repo_path, query)
+        file_contents = "".join(
+            f"\n\n=== File: {rel_path} ===\n{content}" for rel_path, content in selected
+        )
         
-        print(f"File contents collected ({len(file_contents)} chars)")
+        print(f"File contents collected ({len(selected)} files, "
+              f"{len(file_contents)} chars)")
         
         full_context = f"""Repository Structure:
 {repo_map}
@@ -283,7 +633,6 @@ IMPORTANT: Directly modify the existing files listed above. Do not create new he
             return
 
         # Add timestamp to branch name to avoid conflicts
-        import time
         timestamp = int(time.time())
         branch_name = f"feature/issue-{issue_id}-{timestamp}"
         
@@ -312,7 +661,7 @@ IMPORTANT: Directly modify the existing files listed above. Do not create new he
                     title=f"Fix issue #{issue_id}: {issue.title}",
                     body=f"Automated fix for issue #{issue_id}.\n\n{issue.body}",
                     head=branch_name,
-                    base=self.repo.default_branch
+                    base=self._default_branch
                 )
                 print(f"Success! PR created: {pr.html_url}")
             except Exception as e:
@@ -327,20 +676,47 @@ IMPORTANT: Directly modify the existing files listed above. Do not create new he
         Returns list of file paths.
         """
         try:
-            files = list(pr.get_files())
-            return [f.filename for f in files if f.status != "removed"]
+            return [f.filename for f in pr.get_files() if f.status != "removed"]
         except Exception as e:
             print(f"Error fetching PR files: {e}")
             return []
 
+    def get_repo_map(self, repo_git: Repo) -> str:
+        """Returns the repo map for the current checkout, cached by HEAD commit."""
+        try:
+            sha = repo_git.head.commit.hexsha
+        except Exception:
+            return generate_repo_map(self.local_repo_path)
+        return _repo_map_cached(sha, self.local_repo_path, self.cache_dir)
+
+    def _read_file_safe(self, file_path: str) -> Tuple[str, Optional[str]]:
+        """
+        Reads a repository file relative to the local checkout.
+        Returns (file_path, content), with content None if the file is missing,
+        unreadable or resolves outside the repository.
+        """
+        repo_root = os.path.realpath(self.local_repo_path)
+        full_path = os.path.realpath(os.path.join(repo_root, file_path))
+        if os.path.commonpath([repo_root, full_path]) != repo_root:
+            print(f"Skipping {file_path}: path is outside the repository")
+            return file_path, None
+        if not os.path.exists(full_path):
+            return file_path, None
+        try:
+            with open(full_path, "r", encoding="utf-8") as f:
+                return file_path, f.read()
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            return file_path, None
+
     def process_pr_feedback(self, pr_number: int):
         """Orchestrates the feedback loop for an existing PR."""
         print(f"Processing Feedback for PR #{pr_number}...")
         pr = self.repo.get_pull(pr_number)
         
         # Loop protection
-        commits = list(pr.get_commits())
-        if len(commits) >= 3:
+        # pr.commits is the commit count from the PR payload; no extra pagination needed
+        if pr.commits >= 3:
             print("Max iterations (3) reached. Halting.")
             try:
                 pr.create_issue_comment("AI Code Agent: Max repair attempts reached. Please review manually.")
@@ -348,20 +724,28 @@ IMPORTANT: Directly modify the existing files listed above. Do not create new he
                 pass
             return
 
-        feedback_history = self.get_feedback_history(pr)
         branch_name = pr.head.ref
-        
-        # Ensure repo
-        try:
-            repo_git = self._ensure_local_repo()
-            repo_git.git.checkout(branch_name)
-        except Exception as e:
-            print(f"Error preparing repository for PR: {e}")
-            return
 
-        # Get changed files from PR dynamically
-        print("Fetching changed files from PR...")
-        changed_files = self.get_pr_changed_files(pr)
+        # Feedback history, changed files and the repository checkout are
+        # independent network round-trips, so overlap them.
+        print("Fetching feedback history and changed files from PR...")
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            history_future = executor.submit(self.get_feedback_history, pr)
+            files_future = executor.submit(self.get_pr_changed_files, pr)
+            repo_future = executor.submit(self._ensure_local_repo)
+
+            # Ensure repo
+            try:
+                repo_git = repo_future.result()
+                # Reset the local branch to the remote head in case it is left
+                # over from a previous run
+                repo_git.git.checkout("-B", branch_name, f"origin/{branch_name}")
+            except Exception as e:
+                print(f"Error preparing repository for PR: {e}")
+                return
+
+            feedback_history = history_future.result()
+            changed_files = files_future.result()
         
         if not changed_files:
             print("No changed files found in PR.")
@@ -370,22 +754,18 @@ IMPORTANT: Directly modify the existing files listed above. Do not create new he
         print(f"Found {len(changed_files)} changed files: {changed_files}")
         
         # Read current content of all changed files
-        current_code = {}
-        for file_path in changed_files:
-            full_path = os.path.join(self.local_repo_path, file_path)
-            if os.path.exists(full_path):
-                try:
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        current_code[file_path] = f.read()
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = executor.map(self._read_file_safe, changed_files)
+            current_code = {
+                path: content for path, content in results if content is not None
+            }
         
         if not current_code:
             print("Could not read any changed files.")
             return
         
         try:
-            repo_map = generate_repo_map(self.local_repo_path)
+            repo_map = self.get_repo_map(repo_git)
         except Exception:
             repo_map = ""
         
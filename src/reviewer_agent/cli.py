@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 import json
@@ -6,6 +7,18 @@ from reviewer_agent.service import ReviewerService
 
 def main():
     print("Starting Reviewer Agent...")
+
+    parser = argparse.ArgumentParser(description="Reviewer Agent CLI")
+    parser.add_argument("--pr-numbers", type=int, nargs="+",
+                        help="Review these PRs in one batched LLM request "
+                             "instead of the PR from the event")
+    parser.add_argument("--repo", type=str, default=os.getenv("GITHUB_REPOSITORY"),
+                        help="Repository name (owner/repo), required with --pr-numbers")
+    args = parser.parse_args()
+
+    if args.pr_numbers and not args.repo:
+        print("Error: --repo (or GITHUB_REPOSITORY) is required with --pr-numbers.")
+        sys.exit(1)
     
     # 1. Read Event Path logic (Adapter logic)
     event_path = os.getenv("GITHUB_EVENT_PATH")
@@ -61,6 +74,11 @@ def main():
     else:
         llm_client = MockLLMClient()
 
+    if args.pr_numbers:
+        service = ReviewerService(token, args.repo, llm_client)
+        service.process_pr_reviews(args.pr_numbers)
+        return
+
     service = ReviewerService(token, repo_name, llm_client)
     service.process_pr_review(pr_number, pr_body)
 
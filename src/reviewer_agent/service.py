@@ -1,98 +1,371 @@
+import os
 import subprocess
 import re
 import json
 import shlex
+import threading
 import requests
-from typing import Optional, List, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 from github import Github, Repository
 
 from shared.llm import LLMClient
 
+# Linter output beyond this many characters cannot be used by the LLM anyway
+LINTER_OUTPUT_LIMIT = 64 * 1024
+# Seconds before a hung linter is killed
+LINTER_TIMEOUT = 120
+# GitHub's closing keywords ("Fixes #12", "closed: #3"); a bare "#12" is not a link
+_ISSUE_RE = re.compile(
+    r'\b(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?):?\s+#(\d+)\b', re.IGNORECASE
+)
+# Diff bytes downloaded per PR; beyond this the LLM context cannot use it anyway
+DIFF_SIZE_LIMIT = 512 * 1024
+DIFF_TRUNCATED_MARKER = "\n(diff truncated)"
+# New-side file headers in a unified diff ("+++ b/path"); deleted files show /dev/null
+_DIFF_FILE_RE = re.compile(r'^\+\+\+ b/(.+)$', re.MULTILINE)
+
+# A check run with one of these conclusions fails the PR regardless of the rest
+TERMINAL_FAILURE_CONCLUSIONS = frozenset({"failure", "timed_out", "cancelled"})
+# Upper bound on check runs inspected per PR
+MAX_CHECK_RUNS = 50
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Everything the review needs about a PR, in one round-trip
+PR_CONTEXT_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      body
+      commits(last: 1) {
+        nodes {
+          commit {
+            checkSuites(first: 20) {
+              pageInfo { hasNextPage }
+              nodes {
+                checkRuns(first: 50) {
+                  pageInfo { hasNextPage }
+                  nodes { name status conclusion url }
+                }
+              }
+            }
+          }
+        }
+      }
+      closingIssuesReferences(first: 1) {
+        nodes { number title body }
+      }
+    }
+  }
+}
+"""
+
+
+# PyGithub clients by token and repositories by (token, repo name), shared by
+# all ReviewerService instances in the process so each repo is resolved once
+_GH_CLIENTS: Dict[str, Github] = {}
+_REPOS: Dict[Tuple[str, str], Repository.Repository] = {}
+_GH_CACHE_LOCK = threading.Lock()
+
+
+def _get_repo(
+    github_token: str, repo_name: str
+) -> Tuple[Github, Repository.Repository]:
+    """Returns the cached client and repository, creating them on first use."""
+    with _GH_CACHE_LOCK:
+        github = _GH_CLIENTS.get(github_token)
+        if github is None:
+            # Largest page size GitHub allows, so paginated listings need fewer calls
+            github = _GH_CLIENTS[github_token] = Github(github_token, per_page=100)
+        repo = _REPOS.get((github_token, repo_name))
+        if repo is None:
+            repo = _REPOS[(github_token, repo_name)] = github.get_repo(repo_name)
+    return github, repo
+
+
+@dataclass
+class PRContext:
+    """PR data fetched with a single GraphQL query."""
+    body: str
+    check_runs: List[Dict[str, Any]] = field(default_factory=list)
+    linked_issue: Optional[Dict[str, Any]] = None
+    # True if the query's page sizes cut off some suites or check runs
+    checks_truncated: bool = False
+
+
+@dataclass
+class ReviewInputs:
+    """Everything gathered about a PR before it is sent to the LLM."""
+    pr: Any
+    issue_text: str
+    diff_text: str
+    linter_output: str
+    ci_status: Dict[str, Any]
+
+    def llm_args(self) -> Tuple[str, str, str]:
+        """Returns the (issue_text, diff, linter_output) arguments for review_pr."""
+        full_linter_output = (
+            f"=== CI Pipeline Status ===\n{self.ci_status['summary']}\n\n"
+            f"=== Local Linter Results ===\n{self.linter_output}"
+        )
+        return self.issue_text, self.diff_text, full_linter_output
+
 
 class ReviewerService:
     def __init__(self, github_token: str, repo_name: str, llm_client: LLMClient):
         self.github_token = github_token
-        self.github = Github(github_token)
-        self.repo: Repository.Repository = self.github.get_repo(repo_name)
+        self.github, self.repo = _get_repo(github_token, repo_name)
         self.llm_client = llm_client
+        self.http = self._create_http_session()
+
+    def _create_http_session(self) -> requests.Session:
+        """Creates a keep-alive session for the diff download and GraphQL calls."""
+        session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry)
+        session.mount("https://", adapter)
+        session.headers.update({"Authorization": f"token {self.github_token}"})
+        return session
+
+    def _fetch_pr_context(self, pr_number: int) -> Optional[PRContext]:
+        """
+        Fetches PR body, head commit check runs and the first closing issue
+        with one GraphQL query. Returns None if the query fails.
+        """
+        owner, name = self.repo.full_name.split("/", 1)
+        try:
+            response = self.http.post(
+                GITHUB_GRAPHQL_URL,
+                json={"query": PR_CONTEXT_QUERY,
+                      "variables": {"owner": owner, "name": name, "number": pr_number}},
+                timeout=30
+            )
+            payload = response.json()
+            if response.status_code != 200 or payload.get("errors"):
+                print(f"GraphQL query failed: {response.status_code} "
+                      f"{payload.get('errors')}")
+                return None
+            pr_data = payload["data"]["repository"]["pullRequest"]
+        except Exception as e:
+            print(f"Error fetching PR context via GraphQL: {e}")
+            return None
+
+        # GraphQL enums are upper case; normalize to the REST API's values
+        check_runs = []
+        checks_truncated = False
+        for commit in pr_data["commits"]["nodes"]:
+            suites = commit["commit"]["checkSuites"]
+            checks_truncated |= suites["pageInfo"]["hasNextPage"]
+            for suite in suites["nodes"]:
+                checks_truncated |= suite["checkRuns"]["pageInfo"]["hasNextPage"]
+                for run in suite["checkRuns"]["nodes"]:
+                    check_runs.append({
+                        "name": run["name"],
+                        "status": (run["status"] or "").lower(),
+                        "conclusion": (run["conclusion"] or "").lower() or None,
+                        "url": run["url"]
+                    })
+
+        issues = pr_data["closingIssuesReferences"]["nodes"]
+        return PRContext(
+            body=pr_data["body"] or "",
+            check_runs=check_runs,
+            linked_issue=issues[0] if issues else None,
+            checks_truncated=checks_truncated
+        )
 
     def run_linter(self, command: str) -> str:
-        """Runs a linter command and returns its output."""
+        """
+        Runs a linter command and returns its output (stdout and stderr merged).
+        Output beyond LINTER_OUTPUT_LIMIT characters is discarded, and the
+        linter is killed if it runs longer than LINTER_TIMEOUT seconds.
+        """
         try:
             args = shlex.split(command)
-            result = subprocess.run(
-                args, 
-                capture_output=True, 
-                text=True, 
-                shell=False 
+            proc = subprocess.Popen(
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                # Linters may echo source bytes that are not valid UTF-8
+                encoding="utf-8",
+                errors="replace",
+                shell=False
             )
-            # Combine stdout and stderr
-            return f"Command: {command}\nExit Code: {result.returncode}\nOutput:\n{result.stdout}\n{result.stderr}\n"
         except Exception as e:
             return f"Error running {command}: {e}\n"
 
+        timed_out = threading.Event()
+
+        def kill() -> None:
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(LINTER_TIMEOUT, kill)
+        timer.start()
+        try:
+            output = proc.stdout.read(LINTER_OUTPUT_LIMIT)
+            # Keep draining so the linter never blocks on a full pipe
+            truncated = False
+            while proc.stdout.read(LINTER_OUTPUT_LIMIT):
+                truncated = True
+            returncode = proc.wait()
+        except Exception as e:
+            proc.kill()
+            proc.wait()
+            return f"Error running {command}: {e}\n"
+        finally:
+            timer.cancel()
+            proc.stdout.close()
+
+        if truncated:
+            output += "\n(output truncated)"
+        if timed_out.is_set():
+            output += f"\n(killed after {LINTER_TIMEOUT}s timeout)"
+        return f"Command: {command}\nExit Code: {returncode}\nOutput:\n{output}\n"
+
+    def changed_python_files(self, diff_text: str) -> Optional[List[str]]:
+        """
+        Returns the Python files the diff adds or modifies that exist in the
+        working tree, or None if the list cannot be trusted: the diff is
+        missing or incomplete, or none of its Python files are checked out.
+        """
+        if (not diff_text.startswith("diff --git")
+                or diff_text.endswith(DIFF_TRUNCATED_MARKER)):
+            return None
+        files = dict.fromkeys(_DIFF_FILE_RE.findall(diff_text))
+        changed = [f for f in files if f.endswith((".py", ".pyi"))]
+        present = [f for f in changed if os.path.isfile(f)]
+        if changed and not present:
+            return None
+        return present
+
+    def _run_pr_linters(self, diff_future: "Future[str]") -> str:
+        """
+        Runs ruff on the Python files the PR touches (the whole tree if they are
+        unknown, not at all if there are none) and mypy on the tree.
+        """
+        changed = self.changed_python_files(diff_future.result())
+        if changed is None:
+            return self.run_linters_parallel(["ruff check .", "mypy ."])
+        if not changed:
+            note = "Command: ruff check\nSkipped: no Python files changed\n"
+            return note + self.run_linters_parallel(["mypy ."])
+        ruff_command = "ruff check -- " + " ".join(shlex.quote(f) for f in changed)
+        return self.run_linters_parallel([ruff_command, "mypy ."])
+
+    def run_linters_parallel(self, commands: List[str]) -> str:
+        """Runs independent linter commands concurrently; output is in input order."""
+        if not commands:
+            return ""
+        # Each linter is a child process; run_linter's pipe reads and wait()
+        # release the GIL, so threads suffice
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            futures = [executor.submit(self.run_linter, cmd) for cmd in commands]
+            return "".join(f.result() for f in futures)
+
     def get_linked_issue_number(self, pr_body: str) -> Optional[int]:
         """Extracts the first linked issue number from PR body (e.g., 'Closes #123')."""
         if not pr_body:
             return None
-        match = re.search(r'#(\d+)', pr_body)
+        match = _ISSUE_RE.search(pr_body)
         return int(match.group(1)) if match else None
 
-    def get_ci_jobs_status(self, pr) -> Dict[str, Any]:
+    def summarize_checks(
+        self, check_runs: Iterable[Dict[str, Any]], truncated: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Builds the overall CI status dict from check run dicts
+        (name, status, conclusion, url). Iteration stops at the first terminal
+        failure, since the outcome is then decided, or after MAX_CHECK_RUNS items.
+        truncated says the caller already knows check_runs is incomplete; an
+        incomplete list is never reported as "success".
+        """
+        checks_info: List[Dict[str, Any]] = []
+        failed_checks: List[str] = []
+        pending_checks: List[str] = []
+        terminal_failure = False
+        
+        runs = iter(check_runs)
+        for check in runs:
+            checks_info.append(check)
+            
+            if check["status"] != "completed":
+                pending_checks.append(check["name"])
+            elif check["conclusion"] not in ("success", "skipped", "neutral"):
+                failed_checks.append(f"{check['name']}: {check['conclusion']}")
+                if check["conclusion"] in TERMINAL_FAILURE_CONCLUSIONS:
+                    terminal_failure = True
+                    break
+            if len(checks_info) >= MAX_CHECK_RUNS:
+                truncated = truncated or next(runs, None) is not None
+                break
+
+        inspected = f" (first {len(checks_info)} inspected)" if truncated else ""
+        
+        # Determine overall status
+        if terminal_failure:
+            overall_status = "failed"
+            summary = (f"Failed checks: {', '.join(failed_checks)} "
+                       f"(stopped after {len(checks_info)} checks)")
+        elif pending_checks:
+            overall_status = "pending"
+            summary = f"Pending checks: {', '.join(pending_checks)}{inspected}"
+        elif failed_checks:
+            overall_status = "failed"
+            summary = f"Failed checks: {', '.join(failed_checks)}{inspected}"
+        elif truncated:
+            overall_status = "unknown"
+            summary = ("No failures found, but not all checks "
+                       f"were inspected{inspected}.")
+        elif checks_info:
+            overall_status = "success"
+            summary = f"All {len(checks_info)} checks passed."
+        else:
+            overall_status = "no_checks"
+            summary = "No CI checks configured for this repository."
+        
+        return {
+            "status": overall_status,
+            "checks": checks_info,
+            "summary": summary,
+            "failed": failed_checks,
+            "pending": pending_checks
+        }
+
+    def get_ci_jobs_status(
+        self, pr, context: Optional[PRContext] = None
+    ) -> Dict[str, Any]:
         """
         Fetches the status of CI jobs (GitHub Checks) for the PR's head commit.
+        Uses the pre-fetched GraphQL context when given, else the REST API.
         Returns a structured dict with overall status and individual check details.
         """
+        if context is not None:
+            return self.summarize_checks(context.check_runs, context.checks_truncated)
+
         try:
-            # Get the latest commit on the PR
-            commits = list(pr.get_commits())
-            if not commits:
+            # Get the latest commit on the PR directly instead of paginating all commits
+            head_sha = pr.head.sha
+            if not head_sha:
                 return {"status": "unknown", "checks": [], "summary": "No commits found."}
             
-            head_commit = commits[-1]
-            
-            # Get check runs for the commit
-            check_runs = list(head_commit.get_check_runs())
-            
-            checks_info: List[Dict[str, Any]] = []
-            failed_checks: List[str] = []
-            pending_checks: List[str] = []
+            head_commit = self.repo.get_commit(head_sha)
             
-            for check in check_runs:
-                check_info = {
+            # Check runs are consumed lazily, so later pages are only fetched if needed
+            return self.summarize_checks(
+                {
                     "name": check.name,
                     "status": check.status,
                     "conclusion": check.conclusion,
                     "url": check.html_url
                 }
-                checks_info.append(check_info)
-                
-                if check.status != "completed":
-                    pending_checks.append(check.name)
-                elif check.conclusion not in ("success", "skipped", "neutral"):
-                    failed_checks.append(f"{check.name}: {check.conclusion}")
-            
-            # Determine overall status
-            if pending_checks:
-                overall_status = "pending"
-                summary = f"Pending checks: {', '.join(pending_checks)}"
-            elif failed_checks:
-                overall_status = "failed"
-                summary = f"Failed checks: {', '.join(failed_checks)}"
-            elif checks_info:
-                overall_status = "success"
-                summary = f"All {len(checks_info)} checks passed."
-            else:
-                overall_status = "no_checks"
-                summary = "No CI checks configured for this repository."
-            
-            return {
-                "status": overall_status,
-                "checks": checks_info,
-                "summary": summary,
-                "failed": failed_checks,
-                "pending": pending_checks
-            }
+                for check in head_commit.get_check_runs()
+            )
             
         except Exception as e:
             print(f"Error fetching CI status: {e}")
@@ -101,17 +374,30 @@ class ReviewerService:
     def get_pr_diff(self, pr) -> str:
         """Fetches the actual diff content from the PR."""
         try:
-            # Use requests to fetch the diff directly
-            headers = {
-                "Authorization": f"token {self.github_token}",
-                "Accept": "application/vnd.github.v3.diff"
-            }
-            response = requests.get(pr.diff_url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                return response.text
-            else:
-                print(f"Failed to fetch diff: {response.status_code}")
-                return f"(Could not fetch diff: HTTP {response.status_code})"
+            # Fetch the diff directly over the shared keep-alive session
+            headers = {"Accept": "application/vnd.github.v3.diff"}
+            with self.http.get(
+                pr.diff_url, headers=headers, timeout=30, stream=True
+            ) as response:
+                if response.status_code != 200:
+                    print(f"Failed to fetch diff: {response.status_code}")
+                    return f"(Could not fetch diff: HTTP {response.status_code})"
+
+                # Stream at most DIFF_SIZE_LIMIT bytes instead of buffering huge diffs
+                chunks: List[bytes] = []
+                total = 0
+                truncated = False
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    if total > DIFF_SIZE_LIMIT:
+                        truncated = True
+                        break
+
+            diff = b"".join(chunks)[:DIFF_SIZE_LIMIT].decode("utf-8", errors="replace")
+            if truncated:
+                diff += DIFF_TRUNCATED_MARKER
+            return diff
         except Exception as e:
             print(f"Error fetching diff: {e}")
             return f"(Error fetching diff: {e})"
@@ -119,45 +405,105 @@ class ReviewerService:
     def process_pr_review(self, pr_number: int, pr_body: str = ""):
         """Orchestrates the PR review process."""
         print(f"Starting Review for PR #{pr_number}...")
-        
+        inputs = self._gather_review_inputs(pr_number, pr_body)
+        if inputs is None:
+            return
+
+        # 5. LLM Review (include CI status in analysis)
+        print("Analysing with LLM...")
+        review_result = self.llm_client.review_pr(*inputs.llm_args())
+        self._post_review(pr_number, inputs, review_result)
+
+    def process_pr_reviews(self, pr_numbers: List[int]):
+        """
+        Reviews a queue of PRs with a single batched LLM request.
+        PR data is gathered one PR at a time; comments are posted once the
+        batch returns. The working directory is not any one PR's checkout, so
+        local linters are skipped and CI results stand in for them.
+        """
+        prepared: List[Tuple[int, ReviewInputs]] = []
+        for pr_number in pr_numbers:
+            print(f"Starting Review for PR #{pr_number}...")
+            inputs = self._gather_review_inputs(pr_number, run_linters=False)
+            if inputs is not None:
+                prepared.append((pr_number, inputs))
+        if not prepared:
+            return
+
+        print(f"Analysing {len(prepared)} PRs with LLM...")
+        results = self.llm_client.review_prs_batch(
+            [inputs.llm_args() for _, inputs in prepared]
+        )
+        for (pr_number, inputs), review_result in zip(prepared, results):
+            self._post_review(pr_number, inputs, review_result)
+
+    def _gather_review_inputs(
+        self, pr_number: int, pr_body: str = "", run_linters: bool = True
+    ) -> Optional[ReviewInputs]:
+        """
+        Collects the diff, linter results, linked issue and CI status for a PR.
+        Local linters only make sense when the PR is checked out in the working
+        directory; with run_linters=False they are skipped.
+        """
         try:
             pr = self.repo.get_pull(pr_number)
-            if not pr_body:
-                pr_body = pr.body or ""
         except Exception as e:
             print(f"Error fetching PR: {e}")
-            return
+            return None
 
-        # 1. Get Diff
-        print("Fetching diff...")
-        diff_text = self.get_pr_diff(pr)
-
-        # 2. Get Linked Issue
-        issue_number = self.get_linked_issue_number(pr_body)
-        issue_text = "No linked issue found."
-        if issue_number:
-            try:
-                issue = self.repo.get_issue(issue_number)
-                issue_text = f"Title: {issue.title}\nBody: {issue.body}"
-            except Exception as e:
-                print(f"Error fetching linked issue #{issue_number}: {e}")
-        
-        # 3. Check CI Jobs Status
-        print("Checking CI jobs status...")
-        ci_status = self.get_ci_jobs_status(pr)
+        # The diff download and the linters (which only need the diff's file
+        # list) do not depend on the PR context, so run them while the GitHub
+        # metadata is fetched.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # 1. Get Diff
+            print("Fetching diff...")
+            diff_future = executor.submit(self.get_pr_diff, pr)
+
+            # 2. Run Linters
+            linters_future = None
+            if run_linters:
+                print("Running linters...")
+                linters_future = executor.submit(self._run_pr_linters, diff_future)
+
+            # Body, CI checks and linked issue in one GraphQL round-trip
+            # (REST fallback below)
+            context = self._fetch_pr_context(pr_number)
+            if not pr_body:
+                pr_body = context.body if context else (pr.body or "")
+
+            # 3. Get Linked Issue
+            issue_text = "No linked issue found."
+            if context and context.linked_issue:
+                issue = context.linked_issue
+                issue_text = f"Title: {issue['title']}\nBody: {issue['body']}"
+            else:
+                issue_number = self.get_linked_issue_number(pr_body)
+                if issue_number:
+                    try:
+                        issue = self.repo.get_issue(issue_number)
+                        issue_text = f"Title: {issue.title}\nBody: {issue.body}"
+                    except Exception as e:
+                        print(f"Error fetching linked issue #{issue_number}: {e}")
+            
+            # 4. Check CI Jobs Status
+            print("Checking CI jobs status...")
+            ci_status = self.get_ci_jobs_status(pr, context)
+
+            diff_text = diff_future.result()
+            if linters_future is not None:
+                linter_output = linters_future.result()
+            else:
+                linter_output = "Skipped: the PR is not checked out locally."
+
+        return ReviewInputs(pr, issue_text, diff_text, linter_output, ci_status)
+
+    def _post_review(
+        self, pr_number: int, inputs: ReviewInputs, review_result: Dict[str, Any]
+    ):
+        """Renders the review comment and posts it to the PR."""
+        pr, ci_status, linter_output = inputs.pr, inputs.ci_status, inputs.linter_output
         ci_summary = ci_status["summary"]
-        
-        # 4. Run Linters
-        print("Running linters...")
-        linter_output = ""
-        linter_output += self.run_linter("ruff check .")
-        linter_output += self.run_linter("mypy .")
-        
-        # 5. LLM Review (include CI status in analysis)
-        print("Analysing with LLM...")
-        full_linter_output = f"=== CI Pipeline Status ===\n{ci_summary}\n\n=== Local Linter Results ===\n{linter_output}"
-        review_result = self.llm_client.review_pr(issue_text, diff_text, full_linter_output)
-        
+
         # Add CI info to review result
         review_result["ci_status"] = ci_status["status"]
         review_result["ci_summary"] = ci_summary
@@ -172,7 +518,7 @@ class ReviewerService:
             "error": "⚠️"
         }.get(ci_status["status"], "❓")
         
-        comment_body = f"""## AI Review: {review_result['status']}
+        parts: List[str] = [f"""## AI Review: {review_result['status']}
 
 ### CI Pipeline Status: {ci_status_emoji} {ci_status['status'].upper()}
 {ci_summary}
@@ -182,11 +528,13 @@ class ReviewerService:
 
 | Check | Status | Conclusion |
 |-------|--------|------------|
-"""
-        for check in ci_status.get("checks", []):
-            comment_body += f"| {check['name']} | {check['status']} | {check.get('conclusion', 'N/A')} |\n"
-        
-        comment_body += f"""
+"""]
+        parts.extend(
+            f"| {check['name']} | {check['status']} "
+            f"| {check.get('conclusion', 'N/A')} |\n"
+            for check in ci_status.get("checks", [])
+        )
+        parts.append(f"""
 </details>
 
 <details>
@@ -199,9 +547,11 @@ class ReviewerService:
 
 ### Structured Feedback
 ```json
-{json.dumps(review_result, indent=2)}
+{json.dumps(review_result, separators=(',', ':'), ensure_ascii=False)}
 ```
-"""
+""")
+        comment_body = "".join(parts)
+
         # 7. Post Comment to PR
         print("Posting comment to PR...")
         try:
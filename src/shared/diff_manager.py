@@ -1,4 +1,35 @@
-import re
+from typing import Iterator, Tuple
+
+SEARCH_MARKER = "<<<<<< SEARCH\n"
+DIVIDER_MARKER = "\n======\n"
+REPLACE_MARKER = "\n>>>>>> REPLACE"
+
+
+def iter_blocks(diff_content: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (search, replace) pairs for each SEARCH/REPLACE block in order.
+
+    Equivalent to finditer over
+    r'<<<<<< SEARCH\n(.*?)\n======\n(.*?)\n>>>>>> REPLACE' with re.DOTALL,
+    but scans the content once with str.find instead of a backtracking regex,
+    which goes quadratic on large payloads with unterminated blocks.
+    """
+    pos = 0
+    while True:
+        start = diff_content.find(SEARCH_MARKER, pos)
+        if start < 0:
+            return
+        search_start = start + len(SEARCH_MARKER)
+        divider = diff_content.find(DIVIDER_MARKER, search_start)
+        if divider < 0:
+            return
+        replace_start = divider + len(DIVIDER_MARKER)
+        end = diff_content.find(REPLACE_MARKER, replace_start)
+        if end < 0:
+            return
+        yield diff_content[search_start:divider], diff_content[replace_start:end]
+        pos = end + len(REPLACE_MARKER)
+
 
 class DiffManager:
     """
@@ -20,41 +51,30 @@ class DiffManager:
         Returns the modified content.
         Raises ValueError if a block cannot be applied.
         """
-        pattern = re.compile(
-            r'<<<<<< SEARCH\n(.*?)\n======\n(.*?)\n>>>>>> REPLACE', 
-            re.DOTALL
-        )
-        
-        matches = list(pattern.finditer(diff_content))
-        
-        if not matches:
-            # Fallback: if no blocks found, assume full file replacement if safe?
-            # Or maybe just return original if really nothing matched?
-            # For this implementation, let's strictly require blocks or assume it's a full replacement 
-            # ONLY if it doesn't look like a diff attempt.
-            # But the plan says "expect partial updates". 
-            # Let's assume if no blocks, we fallback to treating input as full content 
-            # IF it doesn't contain markers.
-            if "<<<<<< SEARCH" not in diff_content:
-                 return diff_content # Treat as full replacement
-            return original_content
+        if "<<<<<< SEARCH" not in diff_content:
+            # No diff attempt at all: treat the input as the full new content
+            return diff_content
 
         modified_content = original_content
         
-        for match in matches:
-            search_block = match.group(1)
-            replace_block = match.group(2)
-            
-            # Check for exact match
-            if search_block in modified_content:
-                # Ensure unique match? For now, replace first occurrence
-                count = modified_content.count(search_block)
-                if count > 1:
-                     raise ValueError(f"Search block matches {count} times. Ambiguous update.")
-                modified_content = modified_content.replace(search_block, replace_block, 1)
-            else:
+        # Blocks are applied as they are scanned; if markers are present but no
+        # complete block is found, the original content is returned unchanged.
+        for search_block, replace_block in iter_blocks(diff_content):
+            # Locate the block and probe once more for a second (ambiguous) match,
+            # instead of scanning the whole content with `in`, count() and replace()
+            idx = modified_content.find(search_block)
+            if idx < 0:
                  # Fuzzy match could go here (stripping whitespace)
                  # For now, strict.
                  raise ValueError(f"Search block not found in content:\n{search_block}")
+            end = idx + len(search_block)
+            if modified_content.find(search_block, max(end, idx + 1)) != -1:
+                 count = modified_content.count(search_block)
+                 raise ValueError(
+                     f"Search block matches {count} times. Ambiguous update."
+                 )
+            modified_content = (
+                modified_content[:idx] + replace_block + modified_content[end:]
+            )
                  
         return modified_content
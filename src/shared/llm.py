@@ -1,6 +1,45 @@
 from abc import ABC, abstractmethod
+import json
 import os
-from typing import Dict, Any
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# Seconds between Batch API status polls, and how long to wait for a batch overall
+BATCH_POLL_INTERVAL = 30
+BATCH_TIMEOUT = 24 * 60 * 60
+_BATCH_FINAL_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+# Markdown code fences (``` or ```json) at the start or end of a line
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|```\s*$", re.MULTILINE | re.IGNORECASE)
+
+
+def _loads_lenient(content: str) -> Optional[Any]:
+    """
+    Parses JSON from an LLM reply. Tries the reply as-is first, then with
+    markdown fences stripped, then the outermost {...} span.
+    Returns None if nothing parses.
+    """
+    content = content.strip()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        pass
+
+    if "```" in content:
+        content = _FENCE_RE.sub("", content).strip()
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            pass
+
+    start, end = content.find("{"), content.rfind("}")
+    if 0 <= start < end:
+        try:
+            return json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+    return None
 
 class LLMClient(ABC):
     """Abstract base class for LLM interactions."""
@@ -30,6 +69,14 @@ class LLMClient(ABC):
         """
         pass
 
+    def review_prs_batch(
+        self, items: List[Tuple[str, str, str]]
+    ) -> List[Dict[str, Any]]:
+        """Reviews several PRs given as (issue_text, diff, linter_output) tuples.
+        Returns one review_pr result per item, in order.
+        """
+        return [self.review_pr(*item) for item in items]
+
     @abstractmethod
     def fix_code(self, current_code: Dict[str, str], feedback: str) -> Dict[str, str]:
         """Generates fixed code based on current code and feedback/reviews.
@@ -74,23 +121,17 @@ class OpenAILLMClient(LLMClient):
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
 
     def _parse_json(self, content: str) -> Dict:
-        import json
-        import re
-        # Strip markdown code blocks if present
-        if "```" in content:
-            content = re.sub(r"```json\s*", "", content)
-            content = re.sub(r"```\s*", "", content)
-        try:
-            data = json.loads(content.strip())
-            # Un-nest common wrappers
-            if isinstance(data, dict):
-                for wrapper in ["files", "changes", "code", "implementation"]:
-                    if wrapper in data and isinstance(data[wrapper], dict) and len(data) == 1:
-                        return data[wrapper]
-            return data
-        except json.JSONDecodeError:
+        data = _loads_lenient(content)
+        if data is None:
             print(f"Failed to parse JSON from LLM: {content}")
             return {}
+        # Un-nest common wrappers
+        if isinstance(data, dict):
+            for wrapper in ["files", "changes", "code", "implementation"]:
+                if (wrapper in data and isinstance(data[wrapper], dict)
+                        and len(data) == 1):
+                    return data[wrapper]
+        return data
 
     def generate_plan(self, issue_text: str) -> str:
         messages = [
@@ -139,7 +180,9 @@ WRONG response: Creating a script to fix typos (DO NOT DO THIS!)
         )
         return self._parse_json(response.choices[0].message.content)
 
-    def review_pr(self, issue_text: str, diff: str, linter_output: str) -> Dict[str, Any]:
+    def _review_messages(
+        self, issue_text: str, diff: str, linter_output: str
+    ) -> List[Dict[str, str]]:
         prompt = f"""
 Review this PR diff against the issue: {issue_text}
 Diff:
@@ -153,15 +196,82 @@ Return ONLY a valid JSON object with:
 - "files_to_fix": list of strings
 - "comments": list of {{ "file": str, "line": int, "message": str }}
 """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        result = self._parse_json(response.choices[0].message.content)
+        return [{"role": "user", "content": prompt}]
+
+    def _review_result(self, content: str) -> Dict[str, Any]:
+        result = self._parse_json(content)
         if not result:
              return {"status": "APPROVE", "summary": "Error parsing review", "comments": []}
         return result
 
+    def review_pr(
+        self, issue_text: str, diff: str, linter_output: str
+    ) -> Dict[str, Any]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._review_messages(issue_text, diff, linter_output)
+        )
+        return self._review_result(response.choices[0].message.content)
+
+    def review_prs_batch(
+        self, items: List[Tuple[str, str, str]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Submits all reviews as one OpenAI Batch API job and waits for it.
+        Items the batch did not answer (failed requests, expired or failed
+        batch) are reviewed with regular calls, so every item gets a result.
+        """
+        if len(items) < 2:
+            return super().review_prs_batch(items)
+
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": self.model, "messages": self._review_messages(*item)},
+            })
+            for i, item in enumerate(items)
+        ]
+        contents: Dict[str, str] = {}
+        try:
+            batch_file = self.client.files.create(
+                file=("reviews.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            deadline = time.monotonic() + BATCH_TIMEOUT
+            while batch.status not in _BATCH_FINAL_STATES:
+                if time.monotonic() >= deadline:
+                    print(f"Review batch {batch.id} timed out, cancelling.")
+                    self.client.batches.cancel(batch.id)
+                    break
+                time.sleep(BATCH_POLL_INTERVAL)
+                batch = self.client.batches.retrieve(batch.id)
+
+            if batch.status != "completed":
+                print(f"Review batch {batch.id} ended with status: {batch.status}")
+            if batch.output_file_id:
+                output = self.client.files.content(batch.output_file_id).text
+                for line in output.splitlines():
+                    record = json.loads(line)
+                    body = (record.get("response") or {}).get("body") or {}
+                    if body.get("choices"):
+                        message = body["choices"][0]["message"]
+                        contents[record["custom_id"]] = message["content"]
+        except Exception as e:
+            print(f"Error running review batch: {e}")
+
+        return [
+            self._review_result(contents[str(i)])
+            if str(i) in contents else self.review_pr(*item)
+            for i, item in enumerate(items)
+        ]
+
     def fix_code(self, current_code: Dict[str, str], feedback: str) -> Dict[str, str]:
         prompt = f"""
 Fix the code based on the feedback.
@@ -1,21 +1,64 @@
 import os
 import ast
+import functools
+import re
 
-def get_python_summary(file_path):
+# Directories that never hold source worth showing to the LLM: VCS metadata,
+# virtualenvs, installed packages and tool caches.
+DEFAULT_IGNORE_DIRS = frozenset({
+    '.git', '__pycache__', 'venv', '.venv', '.env', 'node_modules',
+    'site-packages', '__pypackages__', '.eggs', '.tox', '.nox',
+    '.mypy_cache', '.pytest_cache', '.ruff_cache',
+})
+
+# Python files larger than this (bytes) are listed without a summary
+MAX_SUMMARY_FILE_SIZE = 256 * 1024
+
+def get_python_summary(file_path, st=None):
+    """
+    Returns a summary of classes and functions in a Python file.
+    st may be a stat result the caller already has (e.g. from os.DirEntry).
+    Results are cached per (path, mtime, size), so unchanged files are not
+    re-parsed when the repo map is regenerated in the same process.
+    """
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return _summarize_python_file(file_path)
+
+    if st.st_size > MAX_SUMMARY_FILE_SIZE:
+        return "    (File too large, skipped)"
+    return _cached_python_summary(file_path, st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=4096)
+def _cached_python_summary(file_path, mtime_ns, size):
+    """Cache wrapper for _summarize_python_file; (mtime_ns, size) key the cache."""
+    return _summarize_python_file(file_path)
+
+# A top-level class or function starts at column 0 (decorators sit on the
+# lines above it). Files without one summarize to nothing, so skip parsing them.
+_TOP_LEVEL_DEF_RE = re.compile(rb'^(?:\xef\xbb\xbf)?(?:class|def)\s', re.MULTILINE)
+
+def _summarize_python_file(file_path):
     """Parses a Python file and returns a summary of classes and functions."""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            tree = ast.parse(f.read())
+        with open(file_path, "rb") as f:
+            source = f.read()
+        if not _TOP_LEVEL_DEF_RE.search(source):
+            return ""
+        tree = ast.parse(source, filename=file_path)
     except Exception:
         return "    (Error parsing Python file)"
 
     summary = []
     
-    for node in tree.body:
+    for node in ast.iter_child_nodes(tree):
         if isinstance(node, ast.ClassDef):
             summary.append(f"    class {node.name}:")
-            if ast.get_docstring(node):
-                doc = ast.get_docstring(node).strip().split('\n')[0]
+            docstring = ast.get_docstring(node)
+            if docstring:
+                doc = docstring.strip().split('\n')[0]
                 summary.append(f"      \"\"\"{doc}...\"\"\"")
             # Determine methods
             for item in node.body:
@@ -25,29 +68,94 @@ def get_python_summary(file_path):
         elif isinstance(node, ast.FunctionDef):
             args = [a.arg for a in node.args.args]
             summary.append(f"    def {node.name}({', '.join(args)}):")
-            if ast.get_docstring(node):
-                doc = ast.get_docstring(node).strip().split('\n')[0]
+            docstring = ast.get_docstring(node)
+            if docstring:
+                doc = docstring.strip().split('\n')[0]
                 summary.append(f"      \"\"\"{doc}...\"\"\"")
 
     return "\n".join(summary)
 
+# (root_dir, ignore_dirs, max_chars) -> (mtime stamps of visited paths, repo map)
+_REPO_MAP_CACHE = {}
+
+def _mtime_ns(path):
+    """Returns the path's mtime in ns, or None if it cannot be stat'ed."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 def generate_repo_map(root_dir, ignore_dirs=None, max_chars=4000):
     """
     Generates a text-based tree view of the repository with Python summaries.
     Stops if the output exceeds max_chars to preserve context window.
+
+    Results are memoized per process. A cached map is reused while every
+    directory and Python file it covers keeps its mtime (directory mtimes
+    change when entries are added, removed or renamed).
     """
     if ignore_dirs is None:
-        ignore_dirs = {'.git', '__pycache__', 'venv', '.env', '.mypy_cache', '.pytest_cache'}
+        ignore_dirs = DEFAULT_IGNORE_DIRS
+    root_dir = os.path.normpath(root_dir)
 
+    key = (root_dir, frozenset(ignore_dirs), max_chars)
+    cached = _REPO_MAP_CACHE.get(key)
+    if cached is not None and all(
+        _mtime_ns(path) == mtime for path, mtime in cached[0]
+    ):
+        return cached[1]
+
+    stamps = []
+    repo_map = _build_repo_map(root_dir, ignore_dirs, max_chars, stamps)
+    if all(mtime is not None for _, mtime in stamps):
+        _REPO_MAP_CACHE[key] = (tuple(stamps), repo_map)
+    return repo_map
+
+def _walk(path, level, ignore_dirs, mtime_ns):
+    """
+    Top-down walk over os.scandir yielding (dir_path, level, dir_mtime_ns, files)
+    per directory, where files are os.DirEntry objects sorted by name. Callers
+    stat files through the entry rather than re-resolving their paths.
+    Symlinked directories are not followed, as with os.walk.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError:
+        return
+
+    files, subdirs = [], []
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                if entry.name not in ignore_dirs and not entry.is_symlink():
+                    subdirs.append(entry)
+                continue
+        except OSError:
+            pass
+        files.append(entry)
+
+    yield path, level, mtime_ns, files
+    for entry in subdirs:
+        try:
+            sub_mtime_ns = entry.stat(follow_symlinks=False).st_mtime_ns
+        except OSError:
+            sub_mtime_ns = None
+        yield from _walk(entry.path, level + 1, ignore_dirs, sub_mtime_ns)
+
+def _build_repo_map(root_dir, ignore_dirs, max_chars, stamps):
+    """
+    Walks root_dir and renders the repo map. Appends (path, mtime_ns) for every
+    directory and Python file it reads to stamps, before reading them.
+    """
     repo_map = []
     total_chars = 0
 
-    for root, from_dirs, files in os.walk(root_dir):
-        # Filter directories in-place
-        from_dirs[:] = [d for d in from_dirs if d not in ignore_dirs]
-        
-        level = root.replace(root_dir, '').count(os.sep)
+    walk = _walk(root_dir, 0, ignore_dirs, _mtime_ns(root_dir))
+    for root, level, root_mtime_ns, files in walk:
+        stamps.append((root, root_mtime_ns))
         indent = ' ' * 4 * level
+        sub_indent = indent + '    '
         
         dir_line = f"{indent}{os.path.basename(root)}/"
         repo_map.append(dir_line)
@@ -57,9 +165,8 @@ def generate_repo_map(root_dir, ignore_dirs=None, max_chars=4000):
             repo_map.append(f"{indent}... (Truncated due to size limit)")
             return "\n".join(repo_map)
 
-        sub_indent = ' ' * 4 * (level + 1)
-        for f in files:
-            file_path = os.path.join(root, f)
+        for entry in files:
+            f = entry.name
             file_line = f"{sub_indent}{f}"
             
             repo_map.append(file_line)
@@ -70,7 +177,12 @@ def generate_repo_map(root_dir, ignore_dirs=None, max_chars=4000):
                 return "\n".join(repo_map)
             
             if f.endswith(".py"):
-                summary = get_python_summary(file_path)
+                try:
+                    st = entry.stat()
+                except OSError:
+                    st = None
+                stamps.append((entry.path, st.st_mtime_ns if st else None))
+                summary = get_python_summary(entry.path, st)
                 if summary:
                     # Check if adding summary exceeds limit
                     if total_chars + len(summary) > max_chars:
@@ -64,6 +64,7 @@ class Evaluator:
             success = task.verification_function(temp_dir)
             
             # Explicit close
+            service.close()
             repo.close()
             return success
 
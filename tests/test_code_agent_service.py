@@ -1,6 +1,11 @@
+import json
+import os
 import pytest
 from unittest.mock import MagicMock, patch
-from code_agent.service import CodeAgentService
+from code_agent.service import (
+    CodeAgentService, _iter_code_files, _write_if_changed, batch_lint,
+    select_context_files,
+)
 from shared.llm import MockLLMClient
 
 
@@ -34,3 +39,197 @@ def test_check_code_valid(mock_github_class):
             result = service.check_code("test.py")
             assert result is None
 
+
+def test_batch_lint_groups_errors_by_file():
+    ruff_output = json.dumps([
+        {"filename": "/repo/a.py", "code": "F401",
+         "message": "`os` imported but unused",
+         "location": {"row": 1, "column": 8}},
+        {"filename": "/repo/a.py", "code": "F821", "message": "Undefined name `y`",
+         "location": {"row": 2, "column": 5}},
+    ])
+    with patch('subprocess.run') as mock_run:
+        mock_run.return_value.returncode = 1
+        mock_run.return_value.stdout = ruff_output
+        errors = batch_lint(["/repo/a.py", "/repo/b.py"])
+
+    assert mock_run.call_count == 1
+    assert "/repo/b.py" not in errors
+    assert "F401" in errors["/repo/a.py"]
+    assert "F821" in errors["/repo/a.py"]
+
+def test_check_many_parallel(mock_github_class):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    items = [(f"f{i}.py", "x = 1\n") for i in range(5)] + [
+        ("bad.py", "def bad_syntax("),
+        ("outside.py", "return 1\n"),
+    ]
+
+    results = service.check_many(items)
+
+    assert results["f0.py"] is None
+    assert "SyntaxError" in results["bad.py"]
+    assert "SyntaxError" in results["outside.py"]
+
+def test_syntax_pool_created_lazily_and_closed(mock_github_class):
+    with CodeAgentService("fake-token", "owner/repo", MockLLMClient()) as service:
+        assert service._syntax_pool is None
+        service.check_many([("a.py", "x = 1\n")])
+        assert service._syntax_pool is None
+
+        service.check_many([(f"f{i}.py", "x = 1\n") for i in range(5)])
+        pool = service._syntax_pool
+        assert pool is not None
+
+    assert service._syntax_pool is None
+    with pytest.raises(RuntimeError):
+        pool.submit(int)
+
+def test_broken_syntax_pool_is_discarded(mock_github_class):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    broken = MagicMock()
+    broken.map.side_effect = RuntimeError("pool broken")
+    service._syntax_pool = broken
+    items = [(f"f{i}.py", "x = 1\n") for i in range(5)]
+
+    results = service.check_many(items)
+
+    assert results["f0.py"] is None
+    broken.shutdown.assert_called_once_with(wait=False)
+    assert service._syntax_pool is None
+
+def test_iter_code_files_filters_dirs_exts_and_size(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("x = 1\n")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "b.js").write_text("x")
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / ".hidden" / "c.py").write_text("x")
+    (tmp_path / "big.py").write_text("x" * 6000)
+    (tmp_path / "image.bin").write_text("x")
+
+    rel_paths = [rel for _, rel, _ in _iter_code_files(str(tmp_path), max_size=5000)]
+
+    assert rel_paths == [os.path.join("pkg", "a.py")]
+
+def test_select_context_files_ranks_by_keywords_within_budget(tmp_path):
+    (tmp_path / "parser.py").write_text("p = 1\n" * 10)
+    (tmp_path / "other.py").write_text("o = 1\n" * 10)
+    (tmp_path / "huge.py").write_text("h = 1\n" * 2000)
+
+    with patch('code_agent.service.count_tokens',
+               side_effect=lambda text: len(text) // 4):
+        selected = select_context_files(
+            str(tmp_path), "Fix crash in parser", token_budget=20
+        )
+
+    assert [rel for rel, _ in selected] == ["parser.py"]
+
+def test_read_file_safe_rejects_paths_outside_repo(mock_github_class, tmp_path):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    service.local_repo_path = str(tmp_path / "repo")
+    os.makedirs(service.local_repo_path)
+    with open(os.path.join(service.local_repo_path, "a.py"), "w") as f:
+        f.write("x = 1\n")
+    (tmp_path / "secret.txt").write_text("secret")
+
+    assert service._read_file_safe("a.py") == ("a.py", "x = 1\n")
+    assert service._read_file_safe("../secret.txt") == ("../secret.txt", None)
+    assert service._read_file_safe("missing.py") == ("missing.py", None)
+
+def test_get_repo_map_cached_by_head_sha(mock_github_class, tmp_path):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    service.cache_dir = str(tmp_path / "cache")
+    repo_git = MagicMock()
+    repo_git.head.commit.hexsha = "abc123"
+
+    with patch('code_agent.service.generate_repo_map', return_value="map") as mock_map:
+        assert service.get_repo_map(repo_git) == "map"
+        assert service.get_repo_map(repo_git) == "map"
+
+    assert mock_map.call_count == 1
+    assert (tmp_path / "cache" / "repo_map.abc123.txt").read_text() == "map"
+
+def test_get_feedback_history_uses_last_three_comments(mock_github_class):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    comments = []
+    for i in range(5):
+        c = MagicMock()
+        c.user.login = "reviewer"
+        c.body = f"comment {i}"
+        comments.append(c)
+    pr = MagicMock()
+    pr.get_issue_comments.return_value.reversed = iter(reversed(comments))
+
+    history = service.get_feedback_history(pr)
+
+    assert "comment 1" not in history
+    positions = [history.index(f"comment {n}") for n in (2, 3, 4)]
+    assert positions == sorted(positions)
+
+def test_check_code_compile_time_error(mock_github_class):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+
+    with patch('builtins.open', new_callable=MagicMock) as mock_open:
+        mock_open.return_value.__enter__.return_value.read.return_value = "return 1\n"
+
+        result = service.check_code("test.py")
+        assert "SyntaxError" in result
+
+def test_batch_lint_uses_cache_dir():
+    with patch('subprocess.run') as mock_run:
+        mock_run.return_value.returncode = 0
+        assert batch_lint(["/repo/a.py"], cache_dir="/cache/ruff") == {}
+
+    args = mock_run.call_args[0][0]
+    assert args[args.index("--cache-dir") + 1] == "/cache/ruff"
+    assert args[-1] == "/repo/a.py"
+
+def test_write_if_changed_skips_identical_content(tmp_path):
+    path = str(tmp_path / "a.py")
+
+    assert _write_if_changed(path, b"x = 1\n") is True
+    assert _write_if_changed(path, b"x = 1\n") is False
+    assert _write_if_changed(path, b"x = 2\n") is True
+    with open(path, "rb") as f:
+        assert f.read() == b"x = 2\n"
+
+def test_validate_and_fix_skips_unchanged_files_on_retry(mock_github_class, tmp_path):
+    llm_client = MagicMock()
+    llm_client.fix_code.return_value = {"a.py": "x = 1\n"}
+    service = CodeAgentService("fake-token", "owner/repo", llm_client)
+    service.local_repo_path = str(tmp_path)
+    changes = {"a.py": "def bad(", "b.py": "y = 2\n"}
+
+    with patch.object(service, 'check_many', wraps=service.check_many) as mock_check:
+        assert service.validate_and_fix(changes, MagicMock()) is True
+
+    checked = [[path for path, _ in call.args[0]] for call in mock_check.call_args_list]
+    assert len(checked) == 2
+    assert len(checked[0]) == 2
+    assert checked[1] == [os.path.join(str(tmp_path), "a.py")]
+    assert llm_client.fix_code.call_args.args[0] == {"a.py": "def bad("}
+
+def test_validate_and_fix_diff_on_undecodable_file(mock_github_class, tmp_path):
+    llm_client = MagicMock()
+    llm_client.fix_code.return_value = {}
+    service = CodeAgentService("fake-token", "owner/repo", llm_client)
+    service.local_repo_path = str(tmp_path)
+    (tmp_path / "latin1.py").write_bytes(b"x = '\xe9'\n")
+    diff = "<<<<<< SEARCH\nx\n======\ny\n>>>>>> REPLACE"
+
+    assert service.validate_and_fix({"latin1.py": diff}, MagicMock()) is False
+
+    feedback = llm_client.fix_code.call_args.args[1]
+    assert "Diff Application Error" in feedback
+    assert llm_client.fix_code.call_args.args[0] == {"latin1.py": diff}
+
+def test_validate_and_fix_stages_valid_files_once(mock_github_class, tmp_path):
+    service = CodeAgentService("fake-token", "owner/repo", MockLLMClient())
+    service.local_repo_path = str(tmp_path)
+    repo_git = MagicMock()
+
+    changes = {"a.py": "x = 1\n", "README.md": "docs\n"}
+    assert service.validate_and_fix(changes, repo_git) is True
+
+    repo_git.index.add.assert_called_once_with(["README.md", "a.py"])
@@ -1,5 +1,5 @@
 import pytest
-from shared.diff_manager import DiffManager
+from shared.diff_manager import DiffManager, iter_blocks
 
 @pytest.fixture
 def diff_manager():
@@ -37,6 +37,11 @@ def test_apply_diff_full_replacement(diff_manager):
     diff = "line1_mod\n" # No markers
     assert diff_manager.apply_diff(original, diff) == diff
 
+def test_apply_diff_incomplete_block_keeps_original(diff_manager):
+    original = "line1\n"
+    diff = "<<<<<< SEARCH\nline1\n======\nline2\n" # No REPLACE marker
+    assert diff_manager.apply_diff(original, diff) == original
+
 def test_apply_diff_missing_block(diff_manager):
     original = "line1\n"
     diff = """<<<<<< SEARCH
@@ -58,3 +63,15 @@ new
     
     with pytest.raises(ValueError, match="Ambiguous update"):
         diff_manager.apply_diff(original, diff)
+
+def test_iter_blocks_ignores_unterminated_block():
+    diff = """<<<<<< SEARCH
+a
+======
+b
+>>>>>> REPLACE
+<<<<<< SEARCH
+c
+======
+d"""
+    assert list(iter_blocks(diff)) == [("a", "b")]
@@ -0,0 +1,57 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+from shared.llm import OpenAILLMClient, _loads_lenient
+
+
+def test_loads_lenient_plain_json():
+    assert _loads_lenient('{"a.py": "print(1)"}') == {"a.py": "print(1)"}
+
+def test_loads_lenient_strips_fences():
+    assert _loads_lenient('```json\n{"a": 1}\n```') == {"a": 1}
+
+def test_loads_lenient_keeps_fences_inside_values():
+    content = '{"README.md": "```py\\nx = 1\\n```"}'
+    assert _loads_lenient(content) == {"README.md": "```py\nx = 1\n```"}
+
+def test_loads_lenient_extracts_object_from_prose():
+    assert _loads_lenient('Here you go:\n{"a": 1}\nDone.') == {"a": 1}
+
+def test_loads_lenient_returns_none_on_garbage():
+    assert _loads_lenient("not json") is None
+
+def _batch_output(*records):
+    return "\n".join(json.dumps({
+        "custom_id": custom_id,
+        "response": {"body": {"choices": [{"message": {"content": content}}]}},
+    }) for custom_id, content in records)
+
+def test_review_prs_batch_maps_results_and_falls_back():
+    with patch("openai.OpenAI"):
+        llm = OpenAILLMClient(api_key="key")
+    client = llm.client
+    client.files.create.return_value = SimpleNamespace(id="file-in")
+    client.batches.create.return_value = SimpleNamespace(
+        id="b1", status="in_progress", output_file_id=None
+    )
+    client.batches.retrieve.return_value = SimpleNamespace(
+        id="b1", status="completed", output_file_id="file-out"
+    )
+    # Out of order, and nothing for the third item
+    client.files.content.return_value.text = _batch_output(
+        ("1", '{"status": "REQUEST_CHANGES", "summary": "second"}'),
+        ("0", '{"status": "APPROVE", "summary": "first"}'),
+    )
+
+    items = [("issue", f"diff {i}", "lint") for i in range(3)]
+    with patch("shared.llm.time.sleep"), \
+         patch.object(llm, "review_pr", return_value={
+             "status": "APPROVE", "summary": "direct",
+         }) as mock_review:
+        results = llm.review_prs_batch(items)
+
+    assert [r["summary"] for r in results] == ["first", "second", "direct"]
+    mock_review.assert_called_once_with(*items[2])
+    uploaded = client.files.create.call_args.kwargs["file"][1].decode().splitlines()
+    assert [json.loads(line)["custom_id"] for line in uploaded] == ["0", "1", "2"]
+    assert client.batches.create.call_args.kwargs["endpoint"] == "/v1/chat/completions"
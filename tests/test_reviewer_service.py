@@ -0,0 +1,268 @@
+from concurrent.futures import Future
+import pytest
+from unittest.mock import MagicMock, patch
+from reviewer_agent.service import ReviewerService
+from shared.llm import MockLLMClient
+
+
+@pytest.fixture
+def service():
+    with patch('reviewer_agent.service.Github'), \
+         patch.dict('reviewer_agent.service._GH_CLIENTS', clear=True), \
+         patch.dict('reviewer_agent.service._REPOS', clear=True):
+        yield ReviewerService("fake-token", "owner/repo", MockLLMClient())
+
+def test_github_client_and_repo_shared_between_services(service):
+    other = ReviewerService("fake-token", "owner/repo", MockLLMClient())
+    third = ReviewerService("fake-token", "owner/other", MockLLMClient())
+
+    assert other.github is service.github and other.repo is service.repo
+    assert third.github is service.github
+    assert service.github.get_repo.call_count == 2
+
+def test_run_linters_parallel_keeps_input_order(service):
+    with patch.object(service, 'run_linter', side_effect=lambda cmd: f"[{cmd}]"):
+        output = service.run_linters_parallel(["ruff check .", "mypy ."])
+    assert output == "[ruff check .][mypy .]"
+
+def test_fetch_pr_context_parses_graphql_response(service):
+    service.repo.full_name = "owner/repo"
+    payload = {"data": {"repository": {"pullRequest": {
+        "body": "Closes #7",
+        "commits": {"nodes": [{"commit": {"checkSuites": {
+            "pageInfo": {"hasNextPage": False},
+            "nodes": [{"checkRuns": {
+                "pageInfo": {"hasNextPage": True},
+                "nodes": [
+                    {"name": "tests", "status": "COMPLETED", "conclusion": "FAILURE",
+                     "url": "u1"},
+                    {"name": "lint", "status": "IN_PROGRESS", "conclusion": None,
+                     "url": "u2"},
+                ],
+            }}],
+        }}}]},
+        "closingIssuesReferences": {
+            "nodes": [{"number": 7, "title": "Bug", "body": "Broken"}],
+        },
+    }}}}
+    with patch.object(service.http, 'post') as mock_post:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = payload
+        context = service._fetch_pr_context(5)
+
+    variables = mock_post.call_args.kwargs["json"]["variables"]
+    assert variables == {"owner": "owner", "name": "repo", "number": 5}
+    assert context.linked_issue["number"] == 7
+    assert context.checks_truncated is True
+    assert context.check_runs[0] == {
+        "name": "tests", "status": "completed", "conclusion": "failure", "url": "u1",
+    }
+
+    ci_status = service.get_ci_jobs_status(None, context)
+    assert ci_status["status"] == "failed"
+    assert ci_status["failed"] == ["tests: failure"]
+
+def test_fetch_pr_context_returns_none_on_errors(service):
+    service.repo.full_name = "owner/repo"
+    with patch.object(service.http, 'post') as mock_post:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"errors": [{"message": "boom"}]}
+        assert service._fetch_pr_context(5) is None
+
+def test_http_session_is_authenticated(service):
+    assert service.http.headers["Authorization"] == "token fake-token"
+    assert service.http.get_adapter("https://api.github.com").max_retries.total == 3
+
+def test_summarize_checks_stops_at_first_failure(service):
+    consumed = []
+
+    def runs():
+        conclusions = [("a", "success"), ("b", "timed_out"), ("c", "success")]
+        for name, conclusion in conclusions:
+            consumed.append(name)
+            yield {"name": name, "status": "completed", "conclusion": conclusion,
+                   "url": ""}
+
+    ci_status = service.summarize_checks(runs())
+
+    assert ci_status["status"] == "failed"
+    assert consumed == ["a", "b"]
+
+@pytest.mark.parametrize("body, expected", [
+    ("Fixes #12", 12),
+    ("This PR resolves: #3 and mentions #4", 3),
+    ("closed #7", 7),
+    ("fix #8", 8),
+    ("Follow-up to #5, see also #6", None),
+    ("", None),
+    (None, None),
+])
+def test_get_linked_issue_number(service, body, expected):
+    assert service.get_linked_issue_number(body) == expected
+
+def test_summarize_checks_never_success_when_capped(service):
+    runs = [
+        {"name": f"c{i}", "status": "completed",
+         "conclusion": "failure" if i == 55 else "success", "url": ""}
+        for i in range(60)
+    ]
+
+    ci_status = service.summarize_checks(runs)
+
+    assert ci_status["status"] == "unknown"
+    assert "(first 50 inspected)" in ci_status["summary"]
+    assert len(ci_status["checks"]) == 50
+
+def test_summarize_checks_truncated_by_caller(service):
+    runs = [{"name": "a", "status": "completed", "conclusion": "success", "url": ""}]
+    assert service.summarize_checks(runs)["status"] == "success"
+    assert service.summarize_checks(runs, truncated=True)["status"] == "unknown"
+
+def test_summarize_checks_exactly_at_cap_is_complete(service):
+    runs = [{"name": f"c{i}", "status": "completed", "conclusion": "success", "url": ""}
+            for i in range(50)]
+    assert service.summarize_checks(runs)["summary"] == "All 50 checks passed."
+
+def test_summarize_checks_pending_before_non_terminal_failure(service):
+    ci_status = service.summarize_checks([
+        {"name": "a", "status": "completed", "conclusion": "action_required",
+         "url": ""},
+        {"name": "b", "status": "queued", "conclusion": None, "url": ""},
+    ])
+    assert ci_status["status"] == "pending"
+
+def test_process_pr_review_posts_comment(service):
+    pr = service.repo.get_pull.return_value
+    pr.body = "Fixes #3"
+    with patch.object(service, '_fetch_pr_context', return_value=None), \
+         patch.object(service, 'get_pr_diff', return_value="diff"), \
+         patch.object(service, 'run_linters_parallel', return_value="lint ok"), \
+         patch.object(service, 'get_ci_jobs_status',
+                      return_value={"status": "success", "checks": [],
+                                    "summary": "All 0 checks passed."}):
+        service.process_pr_review(1)
+
+    service.repo.get_issue.assert_called_once_with(3)
+    body = pr.create_issue_comment.call_args.args[0]
+    assert "## AI Review: APPROVE" in body
+    assert "lint ok" in body
+    assert '```json\n{"status":"APPROVE",' in body
+
+def test_process_pr_reviews_batches_llm_calls(service):
+    service.llm_client = MagicMock()
+    service.llm_client.review_prs_batch.return_value = [
+        {"status": "APPROVE"}, {"status": "REQUEST_CHANGES"},
+    ]
+    prs = {1: MagicMock(body=""), 2: MagicMock(body="")}
+    service.repo.get_pull.side_effect = prs.__getitem__
+    with patch.object(service, '_fetch_pr_context', return_value=None), \
+         patch.object(service, 'get_pr_diff',
+                      side_effect=lambda pr: f"diff {pr is prs[2]}"), \
+         patch.object(service, 'run_linters_parallel') as mock_linters, \
+         patch.object(service, 'get_ci_jobs_status',
+                      return_value={"status": "success", "checks": [],
+                                    "summary": "All 0 checks passed."}):
+        service.process_pr_reviews([1, 2])
+
+    items = service.llm_client.review_prs_batch.call_args.args[0]
+    assert [diff for _, diff, _ in items] == ["diff False", "diff True"]
+    mock_linters.assert_not_called()
+    service.llm_client.review_pr.assert_not_called()
+    bodies = [prs[n].create_issue_comment.call_args.args[0] for n in (1, 2)]
+    assert "## AI Review: APPROVE" in bodies[0]
+    assert "## AI Review: REQUEST_CHANGES" in bodies[1]
+
+def test_process_pr_review_lists_checks_in_table(service):
+    pr = service.repo.get_pull.return_value
+    pr.body = ""
+    checks = [
+        {"name": "build", "status": "completed", "conclusion": "success"},
+        {"name": "lint", "status": "in_progress"},
+    ]
+    with patch.object(service, '_fetch_pr_context', return_value=None), \
+         patch.object(service, 'get_pr_diff', return_value="diff"), \
+         patch.object(service, 'run_linters_parallel', return_value="lint ok"), \
+         patch.object(service, 'get_ci_jobs_status',
+                      return_value={"status": "pending", "checks": checks,
+                                    "summary": "1 pending."}):
+        service.process_pr_review(1)
+
+    body = pr.create_issue_comment.call_args.args[0]
+    assert ("|-------|--------|------------|\n"
+            "| build | completed | success |\n"
+            "| lint | in_progress | N/A |\n"
+            "\n</details>") in body
+
+def test_get_pr_diff_streams_up_to_limit(service):
+    response = MagicMock(status_code=200)
+    response.__enter__.return_value = response
+    response.iter_content.return_value = iter([b"a" * 6, b"b" * 6, b"c" * 6])
+    with patch('reviewer_agent.service.DIFF_SIZE_LIMIT', 10), \
+         patch.object(service.http, 'get', return_value=response) as mock_get:
+        diff = service.get_pr_diff(MagicMock(diff_url="https://example.com/1.diff"))
+
+    assert diff == "aaaaaabbbb\n(diff truncated)"
+    assert mock_get.call_args.kwargs["stream"] is True
+
+def test_get_pr_diff_http_error(service):
+    response = MagicMock(status_code=404)
+    response.__enter__.return_value = response
+    with patch.object(service.http, 'get', return_value=response):
+        assert service.get_pr_diff(MagicMock()) == "(Could not fetch diff: HTTP 404)"
+
+def test_run_linter_merges_and_truncates_output(service):
+    with patch('reviewer_agent.service.LINTER_OUTPUT_LIMIT', 10):
+        output = service.run_linter(
+            "python -c \"import sys; print('x' * 50); sys.exit(3)\""
+        )
+
+    assert "Exit Code: 3" in output
+    assert "x" * 10 + "\n(output truncated)" in output
+
+def test_changed_python_files(service, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("")
+    (tmp_path / "README.md").write_text("")
+    diff = (
+        "diff --git a/pkg/a.py b/pkg/a.py\n--- a/pkg/a.py\n+++ b/pkg/a.py\n"
+        "@@ -1 +1 @@\n"
+        "diff --git a/README.md b/README.md\n--- a/README.md\n+++ b/README.md\n"
+        "diff --git a/old.py b/old.py\n--- a/old.py\n+++ /dev/null\n"
+    )
+    assert service.changed_python_files(diff) == ["pkg/a.py"]
+    deleted = diff.replace("+++ b/pkg/a.py", "+++ /dev/null")
+    assert service.changed_python_files(deleted) == []
+    not_checked_out = diff.replace("pkg/a.py", "pkg/b.py")
+    assert service.changed_python_files(not_checked_out) is None
+    assert service.changed_python_files("(Could not fetch diff: HTTP 404)") is None
+    assert service.changed_python_files(diff + "\n(diff truncated)") is None
+
+def test_run_pr_linters_limits_ruff_to_changed_files(service):
+    diff_future = Future()
+    diff_future.set_result("diff")
+
+    def run(changed):
+        with patch.object(service, 'changed_python_files', return_value=changed), \
+             patch.object(service, 'run_linters_parallel',
+                          return_value="out") as mock_run:
+            output = service._run_pr_linters(diff_future)
+        return output, mock_run.call_args.args[0]
+
+    assert run(["a.py", "my file.py"]) == (
+        "out", ["ruff check -- a.py 'my file.py'", "mypy ."]
+    )
+    assert run(None) == ("out", ["ruff check .", "mypy ."])
+    output, commands = run([])
+    assert commands == ["mypy ."]
+    assert "no Python files changed" in output
+
+def test_run_linter_non_utf8_output(service):
+    command = "python -c \"import sys; sys.stdout.buffer.write(b'\\xff\\xfe ok')\""
+    output = service.run_linter(command)
+
+    assert "Exit Code: 0" in output
+    assert "\ufffd\ufffd ok" in output
+
+def test_run_linter_missing_command(service):
+    assert service.run_linter("definitely-not-a-linter .").startswith("Error running")
@@ -1,33 +1,81 @@
+import os
 from unittest.mock import patch
-from shared.utils import generate_repo_map
-
-@patch("os.walk")
-@patch("os.path.exists")
-@patch("builtins.open")
-def test_generate_repo_map_small(mock_open, mock_exists, mock_walk):
-    # Setup mock file system
-    mock_walk.return_value = [
-        ("/root", [], ["file1.py"]),
-    ]
-    mock_open.return_value.__enter__.return_value.read.return_value = "def foo(): pass"
+from shared.utils import generate_repo_map, get_python_summary
+
+def test_generate_repo_map_small(tmp_path):
+    (tmp_path / "file1.py").write_text("def foo(): pass")
     
-    repo_map = generate_repo_map("/root")
+    repo_map = generate_repo_map(str(tmp_path))
     assert "file1.py" in repo_map
     assert "def foo():" in repo_map
 
-@patch("os.walk")
-@patch("os.path.exists")
-@patch("builtins.open")
-def test_generate_repo_map_truncated(mock_open, mock_exists, mock_walk):
-    # Setup mock file system with many files
-    # We will mock walk to return enough items to exceed a small limit
-    mock_walk.return_value = [
-        ("/root", [], ["file1.py", "file2.py", "file3.py"]),
-    ]
-    mock_open.return_value.__enter__.return_value.read.return_value = "def foo(): pass"
+def test_generate_repo_map_truncated(tmp_path):
+    # Setup a file system with enough items to exceed a small limit
+    for name in ["file1.py", "file2.py", "file3.py"]:
+        (tmp_path / name).write_text("def foo(): pass")
     
     # Set a very small limit
-    repo_map = generate_repo_map("/root", max_chars=50)
+    repo_map = generate_repo_map(str(tmp_path), max_chars=50)
     
     assert "truncated" in repo_map
     assert "file3.py" not in repo_map # Should be cut off
+
+def test_generate_repo_map_nested_and_ignored(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "mod.py").write_text("class A: pass")
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "mod.pyc").write_text("")
+    (tmp_path / "README.md").write_text("hi")
+
+    lines = generate_repo_map(str(tmp_path)).splitlines()
+
+    assert lines == [
+        f"{tmp_path.name}/",
+        "    README.md",
+        "    pkg/",
+        "        mod.py",
+        "    class A:",
+    ]
+
+def test_get_python_summary_skips_large_files(tmp_path):
+    path = tmp_path / "big.py"
+    path.write_text("x = 1\n" * 50000)
+    assert get_python_summary(str(path)) == "    (File too large, skipped)"
+
+def test_get_python_summary_cached_until_file_changes(tmp_path):
+    path = tmp_path / "mod.py"
+    path.write_text("def foo(): pass\n")
+    assert "def foo():" in get_python_summary(str(path))
+
+    with patch("shared.utils._summarize_python_file") as mock_summarize:
+        get_python_summary(str(path))
+        mock_summarize.assert_not_called()
+
+    path.write_text("def bar(a): pass\n")
+    assert "def bar(a):" in get_python_summary(str(path))
+
+def test_get_python_summary_skips_parse_without_top_level_defs(tmp_path):
+    path = tmp_path / "settings.py"
+    path.write_text("DEBUG = True\nif DEBUG:\n    def helper(): pass\n")
+
+    with patch("shared.utils.ast.parse") as mock_parse:
+        assert get_python_summary(str(path)) == ""
+        mock_parse.assert_not_called()
+
+def test_get_python_summary_decorated_definitions(tmp_path):
+    path = tmp_path / "mod.py"
+    path.write_text('@decorator\ndef foo(a):\n    """Does foo."""\n')
+
+    assert get_python_summary(str(path)) == '    def foo(a):\n      """Does foo...."""'
+
+def test_generate_repo_map_cached_until_tree_changes(tmp_path):
+    (tmp_path / "a.py").write_text("def foo(): pass\n")
+    first = generate_repo_map(str(tmp_path))
+
+    with patch("shared.utils._build_repo_map") as mock_build:
+        assert generate_repo_map(str(tmp_path)) == first
+        mock_build.assert_not_called()
+
+    (tmp_path / "b.py").write_text("def bar(): pass\n")
+    os.utime(tmp_path, ns=(0, 1))  # make sure the directory mtime visibly changes
+    assert "b.py" in generate_repo_map(str(tmp_path))